@@ -16,6 +16,7 @@
         'views/migration_test_view.xml',
         'views/migration_log_view.xml',
         'data/migration_sample_data.xml',
+        'data/migration_cron.xml',
         'security/ir.model.access.csv', 
     ],
     'installable': True,
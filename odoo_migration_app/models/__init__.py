@@ -6,4 +6,5 @@ from . import migration_models
 from . import migration_origin_models
 from . import migration_origin_fields
 from . import ir_model_fields_inherit
-from . import migration_id_mapping
\ No newline at end of file
+from . import migration_id_mapping
+from . import migration_shard
\ No newline at end of file
@@ -28,8 +28,20 @@ class IrModelFieldsInherit(models.Model):
 
     @api.model
     def name_search(self, name='', args=None, operator='ilike', limit=100):
-        """Permite buscar por nombre técnico o descripción."""
-        args = args or []
-        domain = ['|', ('name', operator, name), ('field_description', operator, name)]
-        recs = self.search(domain + args, limit=limit)
-        return recs.name_get()
+        """Permite buscar por nombre técnico o descripción.
+
+        Con ``migration_field_model`` en el contexto la búsqueda se limita a
+        ese modelo (columna indexada) y las etiquetas se construyen con un
+        único ``search_read``, sin recalcular ``display_name`` fila a fila.
+        """
+        domain = list(args or [])
+        model_name = self.env.context.get('migration_field_model')
+        if model_name:
+            domain = [('model', '=', model_name)] + domain
+        if name:
+            domain = ['|', ('name', operator, name), ('field_description', operator, name)] + domain
+        rows = self.search_read(domain, ['name', 'field_description'], limit=limit)
+        return [
+            (row['id'], f"{row['name']} ({row['field_description']})" if row['field_description'] else row['name'])
+            for row in rows
+        ]
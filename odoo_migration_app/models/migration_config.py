@@ -1,7 +1,12 @@
 import logging
-from odoo import models, fields, api  # type: ignore
+import os
+from odoo import models, fields, api, tools  # type: ignore
 import xmlrpc.client
-from odoo.exceptions import UserError # type: ignore
+from odoo.exceptions import UserError, ValidationError # type: ignore
+
+from ..utils.connection import open_session
+from .migration_shard import is_mapping_conflict, is_retryable_error
+from ..utils.mapping_snapshot import delete_snapshot, load_snapshot, write_snapshot
 
 _logger = logging.getLogger(__name__)
 
@@ -19,6 +24,17 @@ class MigrationConfig(models.Model):
     model_ids = fields.One2many('migration.model', 'config_id', string="Modelos a Migrar")
     field_ids = fields.One2many('migration.fields', 'config_id', string="Campos de Migración")
     id_mapping_ids = fields.One2many('migration.id.mapping', 'config_id', string="Mapeo de IDs")
+    reuse_mapping_snapshots = fields.Boolean(
+        'Reutilizar instantáneas de mapeo',
+        help="Resuelve las relaciones con las instantáneas binarias de ejecuciones anteriores "
+             "y de las configuraciones indicadas antes de consultar la tabla de mapeos."
+    )
+    snapshot_config_ids = fields.Many2many(
+        'migration.config',
+        'migration_config_snapshot_rel', 'config_id', 'source_config_id',
+        string="Mapeos de otras configuraciones",
+        help="Configuraciones con el mismo origen y destino cuyas instantáneas de mapeo se reutilizan."
+    )
     has_models = fields.Boolean(
         string="Tiene Modelos",
         compute="_compute_has_models",
@@ -30,6 +46,25 @@ class MigrationConfig(models.Model):
         for rec in self:
             rec.has_models = bool(rec.model_ids)
 
+    @api.constrains('snapshot_config_ids', 'source_url', 'source_db')
+    def _check_snapshot_configs_source(self):
+        """Los IDs origen solo tienen sentido dentro de su base de datos origen."""
+        referencing = self.search([('snapshot_config_ids', 'in', self.ids)])
+        for rec in self | referencing:
+            other = rec.snapshot_config_ids.filtered(
+                lambda c: (c.source_url, c.source_db) != (rec.source_url, rec.source_db)
+            )
+            if other:
+                raise ValidationError(
+                    f"'{rec.name}' solo puede reutilizar mapeos de configuraciones con el mismo "
+                    f"origen ({rec.source_url} / {rec.source_db}): {', '.join(other.mapped('name'))}"
+                )
+
+    def unlink(self):
+        for rec in self:
+            rec._delete_mapping_snapshots()
+        return super().unlink()
+
     # ==========================
     # MÉTODOS DE CONEXIÓN
     # ==========================
@@ -51,6 +86,15 @@ class MigrationConfig(models.Model):
             _logger.error(f"Error al conectar: {str(e)}")
         return False
 
+    def _open_rpc_session(self):
+        """Abre una sesión RPC propia sin escribir en la configuración.
+
+        La usan los workers de shards, que no deben competir por la fila de
+        la configuración actualizando ``is_connected``.
+        """
+        self.ensure_one()
+        return open_session(self.source_url, self.source_db, self.source_user, self.source_password)
+
     # ==========================
     # NUEVO MÉTODO: TRAER MODELOS
     # ==========================
@@ -95,8 +139,9 @@ class MigrationConfig(models.Model):
         if not uid:
             raise UserError("No hay conexión activa.")
 
-        # Limpiar mapeos anteriores
+        # Limpiar mapeos anteriores y sus instantáneas
         self.id_mapping_ids.unlink()
+        self._delete_mapping_snapshots()
 
         try:
             models_proxy = xmlrpc.client.ServerProxy(f"{self.source_url}/xmlrpc/2/object")
@@ -107,8 +152,7 @@ class MigrationConfig(models.Model):
                 _logger.info(f"🔄 Migrando modelo {origin_model} → {dest_model}")
 
                 # Obtener solo campos mapeados
-                fields_to_fetch = [f.field_origin_id.name for f in model.field_ids if f.field_origin_id]
-                fields_to_fetch.append('id')  # Siempre traer el ID
+                fields_to_fetch = model._get_origin_fields_to_fetch()
                 
                 _logger.info(f"📋 Campos a traer: {fields_to_fetch}")
 
@@ -122,53 +166,10 @@ class MigrationConfig(models.Model):
 
                 # Procesar cada registro
                 for rec in records:
-                    source_record_id = rec['id']
-                    data = {}
-
-                    for field_map in model.field_ids:
-                        if not field_map.field_origin_id or not field_map.field_dest_id:
-                            continue
-
-                        origin_field_name = field_map.field_origin_id.name
-                        dest_field_name = field_map.field_dest_id.name
-                        val = rec.get(origin_field_name)
-
-                        # === CAMPOS RELACIONALES ===
-                        if field_map.is_relational:
-                            val = self._resolve_relation_with_mapping(
-                                models_proxy, uid, field_map, val, source_record_id
-                            )
-                            if val is None and field_map.not_found_action == 'skip':
-                                _logger.warning(f"⏭️  Saltando registro {source_record_id} por relación no encontrada")
-                                break
-                        
-                        if val is not None:
-                            data[dest_field_name] = val
-
-                    # Crear registro en destino si no se saltó
-                    if data:
-                        try:
-                            new_rec = self.env[dest_model].sudo().create(data)
-                            
-                            # 🔥 GUARDAR MAPEO ID
-                            self.env['migration.id.mapping'].create({
-                                'config_id': self.id,
-                                'model_name': dest_model,
-                                'source_id': source_record_id,
-                                'dest_id': new_rec.id,
-                            })
-                            
-                            _logger.info(f"✅ Creado {dest_model} ID {new_rec.id} (origen: {source_record_id})")
-                            
-                        except Exception as e:
-                            _logger.error(f"❌ Error creando registro {source_record_id}: {str(e)}")
-                            # Crear log de error
-                            self.env['migration.log'].create({
-                                'migration_name': self.name,
-                                'status': 'failed',
-                                'message': f"Error en {dest_model} ID {source_record_id}: {str(e)}",
-                                'model_name': dest_model,
-                            })
+                    self._migrate_record(models_proxy, uid, model, rec)
+
+            if self.reuse_mapping_snapshots:
+                self.action_export_mapping_snapshots()
 
             _logger.info("✅ Migración completada")
             return {
@@ -186,6 +187,198 @@ class MigrationConfig(models.Model):
             _logger.error(f"💥 Error durante migración: {str(e)}")
             raise UserError(f"Error durante la migración: {str(e)}")
 
+    def _migrate_record(self, models_proxy, uid, model, rec):
+        """Crea en destino un registro origen y guarda su mapeo. Devuelve el ID destino o None."""
+        dest_model = model.model_dest.model
+        source_record_id = rec['id']
+        data = {}
+
+        for field_map in model.field_ids:
+            if not field_map.field_origin_id or not field_map.field_dest_id:
+                continue
+
+            origin_field_name = field_map.field_origin_id.name
+            dest_field_name = field_map.field_dest_id.name
+            val = rec.get(origin_field_name)
+
+            # === CAMPOS RELACIONALES ===
+            if field_map.is_relational:
+                val = self._resolve_relation_with_mapping(
+                    models_proxy, uid, field_map, val, source_record_id
+                )
+                if val is None and field_map.not_found_action == 'skip':
+                    _logger.warning(f"⏭️  Saltando registro {source_record_id} por relación no encontrada")
+                    break
+            
+            if val is not None:
+                data[dest_field_name] = val
+
+        # Crear registro en destino si no se saltó
+        if not data:
+            return None
+
+        try:
+            # Savepoint propio: si el create falla se deshace solo este registro
+            # y el log de error se puede escribir con la transacción utilizable.
+            with self.env.cr.savepoint():
+                new_rec = self.env[dest_model].sudo().create(data)
+
+                # 🔥 GUARDAR MAPEO ID
+                self.env['migration.id.mapping'].create({
+                    'config_id': self.id,
+                    'model_name': dest_model,
+                    'source_id': source_record_id,
+                    'dest_id': new_rec.id,
+                })
+        except Exception as e:
+            if is_retryable_error(e):
+                raise
+            _logger.error(f"❌ Error creando registro {source_record_id}: {str(e)}")
+            # Crear log de error
+            self.env['migration.log'].create({
+                'migration_name': self.name,
+                'status': 'failed',
+                'message': f"Error en {dest_model} ID {source_record_id}: {str(e)}",
+                'model_name': dest_model,
+            })
+            return None
+
+        _logger.info(f"✅ Creado {dest_model} ID {new_rec.id} (origen: {source_record_id})")
+        return new_rec.id
+
+    def _search_or_create_mapped(self, models_proxy, uid, field_config, related_model, origin_id):
+        """Busca o crea el registro relacionado y guarda su mapeo en un mismo savepoint.
+
+        Si otro worker ya ha mapeado el mismo registro origen, el savepoint
+        deshace también el registro creado aquí y se devuelve el mapeo ganador.
+        """
+        try:
+            with self.env.cr.savepoint():
+                dest_id = self._search_or_create_related(models_proxy, uid, field_config, related_model, origin_id)
+                if dest_id:
+                    self.env['migration.id.mapping'].create({
+                        'config_id': self.id,
+                        'model_name': related_model,
+                        'source_id': origin_id,
+                        'dest_id': dest_id,
+                    })
+                return dest_id
+        except Exception as e:
+            if not is_mapping_conflict(e):
+                raise
+            mapping = self.env['migration.id.mapping'].search([
+                ('config_id', '=', self.id),
+                ('model_name', '=', related_model),
+                ('source_id', '=', origin_id),
+            ], limit=1)
+            if not mapping:
+                # El mapeo ganador se confirmó después de la instantánea de esta
+                # transacción: el worker repite el lote en una transacción nueva.
+                raise
+            _logger.info(f"↔️  Mapeo {related_model} {origin_id} ya registrado por otro worker → {mapping.dest_id}")
+            return mapping.dest_id
+
+    # ==========================
+    # INSTANTÁNEAS DE MAPEO
+    # ==========================
+    def _mapping_snapshot_path(self, model_name):
+        """Ruta de la instantánea de mapeo de un modelo, dentro del filestore."""
+        self.ensure_one()
+        return os.path.join(
+            tools.config.filestore(self.env.cr.dbname),
+            'migration_mappings', f"config_{self.id}", f"{model_name}.bin"
+        )
+
+    def _delete_mapping_snapshots(self, model_name=None):
+        """Borra las instantáneas de la configuración, o solo la de ``model_name``.
+
+        Se llama siempre que se limpian los mapeos, para que una nueva
+        ejecución no resuelva relaciones con los IDs destino de la anterior.
+        """
+        self.ensure_one()
+        if model_name:
+            delete_snapshot(self._mapping_snapshot_path(model_name))
+            return
+        directory = os.path.dirname(self._mapping_snapshot_path('_'))
+        if not os.path.isdir(directory):
+            return
+        for file_name in os.listdir(directory):
+            if file_name.endswith('.bin'):
+                delete_snapshot(os.path.join(directory, file_name))
+        try:
+            os.rmdir(directory)
+        except OSError:
+            _logger.warning(f"⚠️  No se pudo borrar el directorio de instantáneas {directory}")
+
+    def _export_mapping_snapshot(self, model_name):
+        """Vuelca los mapeos de un modelo a su instantánea binaria. Devuelve el número de pares."""
+        self.ensure_one()
+        self.env['migration.id.mapping'].flush_model()
+        cr = self.env.cr
+
+        def rows():
+            # Paginación por clave: el cursor de Odoo trae todo el resultado
+            # de golpe, así que se leen páginas acotadas en orden de source_id.
+            last_source_id = None
+            while True:
+                cr.execute("""
+                    SELECT source_id, dest_id FROM migration_id_mapping
+                     WHERE config_id = %s AND model_name = %s
+                       AND (%s IS NULL OR source_id > %s)
+                     ORDER BY source_id
+                     LIMIT 10000
+                """, [self.id, model_name, last_source_id, last_source_id])
+                page = cr.fetchall()
+                if not page:
+                    return
+                yield from page
+                last_source_id = page[-1][0]
+
+        count = write_snapshot(self._mapping_snapshot_path(model_name), rows())
+        _logger.info(f"💾 Instantánea de mapeo {model_name}: {count} pares")
+        return count
+
+    def action_export_mapping_snapshots(self):
+        """Exporta una instantánea de mapeo por cada modelo mapeado de la configuración."""
+        self.ensure_one()
+        self.env['migration.id.mapping'].flush_model()
+        self.env.cr.execute(
+            "SELECT DISTINCT model_name FROM migration_id_mapping WHERE config_id = %s",
+            [self.id]
+        )
+        model_names = [row[0] for row in self.env.cr.fetchall()]
+        total = sum(self._export_mapping_snapshot(model_name) for model_name in model_names)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Instantáneas de Mapeo',
+                'message': f'{total} mapeos exportados en {len(model_names)} instantáneas',
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def _lookup_snapshot_mapping(self, model_name, source_id):
+        """Busca un ID destino en las instantáneas propias y en las de las configuraciones reutilizadas."""
+        self.ensure_one()
+        if not self.reuse_mapping_snapshots:
+            return None
+        same_source = self.snapshot_config_ids.filtered(
+            lambda c: (c.source_url, c.source_db) == (self.source_url, self.source_db)
+        )
+        for config in self | same_source:
+            snapshot = load_snapshot(config._mapping_snapshot_path(model_name))
+            try:
+                dest_id = snapshot.get(source_id) if snapshot else None
+            except ValueError as e:
+                # Instantánea inservible: se sigue buscando en la tabla de mapeos
+                _logger.warning(f"⚠️  Instantánea de mapeo {model_name} no disponible: {str(e)}")
+                continue
+            if dest_id:
+                return dest_id
+        return None
+
     def _resolve_relation_with_mapping(self, models_proxy, uid, field_config, origin_value, source_record_id):
         """Resuelve relaciones usando mapeo de IDs persistente."""
         
@@ -201,7 +394,12 @@ class MigrationConfig(models.Model):
         if relation_type == 'many2one':
             origin_id = origin_value[0] if isinstance(origin_value, list) else origin_value
             
-            # 1. Buscar en mapeo primero
+            # 1. Buscar en instantáneas y en el mapeo primero
+            dest_id = self._lookup_snapshot_mapping(related_model, origin_id)
+            if dest_id:
+                _logger.info(f"✓ Encontrado en instantánea: {origin_id} → {dest_id}")
+                return dest_id
+
             mapping = self.env['migration.id.mapping'].search([
                 ('config_id', '=', self.id),
                 ('model_name', '=', related_model),
@@ -212,20 +410,8 @@ class MigrationConfig(models.Model):
                 _logger.info(f"✓ Encontrado en mapeo: {origin_id} → {mapping.dest_id}")
                 return mapping.dest_id
             
-            # 2. Si no está en mapeo, buscar/crear
-            dest_id = self._search_or_create_related(models_proxy, uid, field_config, related_model, origin_id)
-            
-            if dest_id:
-                # Guardar en mapeo para futuras referencias
-                self.env['migration.id.mapping'].create({
-                    'config_id': self.id,
-                    'model_name': related_model,
-                    'source_id': origin_id,
-                    'dest_id': dest_id,
-                })
-                return dest_id
-            
-            return None
+            # 2. Si no está en mapeo, buscar/crear y guardar el mapeo para futuras referencias
+            return self._search_or_create_mapped(models_proxy, uid, field_config, related_model, origin_id)
 
         # === MANY2MANY ===
         elif relation_type == 'many2many':
@@ -297,7 +483,9 @@ class MigrationConfig(models.Model):
                     vals = {f.name: remote_data[f.name] 
                         for f in field_config.fields_to_search 
                         if remote_data.get(f.name)}
-                    new_rec = self.env[related_model].sudo().create(vals)
+                    # Savepoint propio: si falla, la transacción sigue utilizable
+                    with self.env.cr.savepoint():
+                        new_rec = self.env[related_model].sudo().create(vals)
                     _logger.info(f"🆕 Creado {related_model} ID {new_rec.id}")
                     return new_rec.id
                 return None
@@ -315,6 +503,8 @@ class MigrationConfig(models.Model):
             return matches.id
 
         except Exception as e:
+            if is_retryable_error(e):
+                raise
             _logger.error(f"❌ Error resolviendo relación: {str(e)}")
             return None
 
@@ -17,16 +17,24 @@ class MigrationField(models.Model):
         store=True
     )
 
+    # Modelos de la configuración, usados por los dominios de los desplegables
+    origin_model_id = fields.Many2one(related='model_id.model_origin', string="Modelo Origen")
+    dest_model_name = fields.Char(related='model_id.model_dest.model', string="Modelo Destino")
+
     # === Campos principales ===
+    # Los dominios se evalúan en el cliente: no hace falta un onchange
+    # para acotar cada desplegable al modelo correspondiente.
     field_origin_id = fields.Many2one(
         'migration.origin.fields',
         string="Campo Origen",
+        domain="[('model_id', '=', origin_model_id)]",
         help="Campo del modelo en la base de datos origen (remota)."
     )
 
     field_dest_id = fields.Many2one(
         'ir.model.fields',
         string="Campo Destino",
+        domain="[('model', '=', dest_model_name)]",
         help="Campo equivalente en la base de datos actual (destino)."
     )
 
@@ -51,6 +59,7 @@ class MigrationField(models.Model):
     fields_to_search = fields.Many2many(
         'ir.model.fields',
         string="Campos de Búsqueda",
+        domain="[('model', '=', related_model)]",
         help="Campos del modelo relacionado (destino) que se usarán para buscar coincidencias.",
         widget='many2many_tags'
     )
@@ -85,35 +94,3 @@ class MigrationField(models.Model):
                 f"[FIELD META] {rec.field_origin_id.name} → "
                 f"type={rec.field_type}, relation={rec.related_model}, relational={rec.is_relational}"
             )
-
-    @api.onchange('model_id', 'related_model', 'field_origin_id')
-    def _onchange_domains(self):
-        """Actualiza los dominios dinámicos según el modelo de migración y el modelo relacionado."""
-        for rec in self:
-            domain_origin = []
-            domain_dest = []
-            domain_search = []
-
-            # --- Campos del modelo origen (remoto)
-            if rec.model_id.model_origin:
-                domain_origin = [('model_id.model', '=', rec.model_id.model_origin.model)]
-
-            # --- Campos del modelo destino (actual)
-            if rec.model_id.model_dest:
-                domain_dest = [('model', '=', rec.model_id.model_dest.model)]
-
-            # --- Campos del modelo relacionado (para búsqueda)
-            if rec.related_model:
-                domain_search = [('model', '=', rec.related_model)]
-
-            _logger.info(
-                f"[onchange_domains] → origen={domain_origin}, destino={domain_dest}, búsqueda={domain_search}"
-            )
-
-            return {
-                'domain': {
-                    'field_origin_id': domain_origin,
-                    'field_dest_id': domain_dest,
-                    'fields_to_search': domain_search,
-                }
-            }
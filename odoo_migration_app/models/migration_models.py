@@ -1,8 +1,11 @@
 import logging
 from odoo import models, fields, api  # type: ignore
+from odoo.models import MAGIC_COLUMNS  # type: ignore
 import xmlrpc.client
 from odoo.exceptions import UserError # type: ignore
 
+from ..utils.field_mapper import FieldIndex
+
 _logger = logging.getLogger(__name__)
 
 class MigrationModel(models.Model):
@@ -13,6 +16,22 @@ class MigrationModel(models.Model):
     model_dest = fields.Many2one('ir.model', string="Modelo Destino")
     field_ids = fields.One2many('migration.fields', 'model_id', string="Campos de Migración")
     config_id = fields.Many2one('migration.config', string="Configuración de Migración")
+
+    # === Migración en shards ===
+    shard_count = fields.Integer(
+        'Workers', default=4,
+        help="Número de workers (procesos cron) que migran el modelo en paralelo."
+    )
+    shard_batch_size = fields.Integer(
+        'Tamaño de lote', default=500,
+        help="Registros que cada worker migra y confirma en cada transacción."
+    )
+    shard_state = fields.Selection([
+        ('none', 'Sin shards'),
+        ('running', 'En Progreso'),
+        ('done', 'Completada'),
+    ], string="Migración en shards", default='none', readonly=True)
+    shard_ids = fields.One2many('migration.shard', 'model_id', string="Shards")
     
     @api.model_create_multi
     def create(self, vals_list):
@@ -21,6 +40,12 @@ class MigrationModel(models.Model):
                 vals['config_id'] = self.env.context['active_id']
         return super().create(vals_list)
 
+
+    def _get_origin_fields_to_fetch(self):
+        """Campos origen mapeados que hay que leer del remoto, siempre con el ID."""
+        fields_to_fetch = [f.field_origin_id.name for f in self.field_ids if f.field_origin_id]
+        fields_to_fetch.append('id')  # Siempre traer el ID
+        return fields_to_fetch
     
     def action_get_fields(self):
         """Trae los campos técnicos del modelo origen remoto."""
@@ -74,3 +99,199 @@ class MigrationModel(models.Model):
                 count += 1
 
         _logger.info(f"✅ {count} campos técnicos importados para {model_origin.model}.")
+
+    def action_auto_map_fields(self):
+        """Propone los pares campo origen → campo destino por nombre y tipo."""
+        self.ensure_one()
+        if not self.model_origin or not self.model_dest:
+            raise UserError("Selecciona el modelo origen y el modelo destino antes de auto-mapear.")
+
+        origin_fields = self.env['migration.origin.fields'].search_read(
+            [('model_id', '=', self.model_origin.id)],
+            ['name', 'ttype', 'relation']
+        )
+        if not origin_fields:
+            raise UserError("No hay campos origen. Pulsa 'Traer Campos' primero.")
+
+        # Un único search_read sobre ir.model.fields para todo el modelo destino
+        index = FieldIndex(self.env['ir.model.fields'].search_read(
+            [
+                ('model', '=', self.model_dest.model),
+                ('store', '=', True),
+                ('ttype', '!=', 'one2many'),  # el motor no migra one2many
+                ('name', 'not in', MAGIC_COLUMNS),
+            ],
+            ['name', 'ttype', 'relation']
+        ))
+
+        mapped_origin = set(self.field_ids.field_origin_id.ids)
+        mapped_dest = set(self.field_ids.field_dest_id.ids)
+
+        vals_list = []
+        for f in origin_fields:
+            if f['id'] in mapped_origin or f['ttype'] == 'one2many':
+                continue
+            dest_id = index.match(f['name'], f['ttype'], f['relation'])
+            if not dest_id or dest_id in mapped_dest:
+                continue
+            mapped_dest.add(dest_id)
+            vals_list.append({
+                'model_id': self.id,
+                'field_origin_id': f['id'],
+                'field_dest_id': dest_id,
+            })
+
+        self.env['migration.fields'].create(vals_list)
+
+        _logger.info(
+            f"🧩 Auto-mapeo {self.model_origin.model} → {self.model_dest.model}: "
+            f"{len(vals_list)} campos propuestos de {len(origin_fields)} ({len(index)} campos destino)"
+        )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Auto-mapeo de Campos',
+                'message': f'{len(vals_list)} campos mapeados automáticamente',
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    # ==========================
+    # MIGRACIÓN EN SHARDS
+    # ==========================
+    def action_start_sharded_migration(self):
+        """Reparte el espacio de IDs origen en shards y lanza los workers."""
+        self.ensure_one()
+        config = self.config_id
+        if not self.model_origin or not self.model_dest:
+            raise UserError("Selecciona el modelo origen y el modelo destino antes de migrar.")
+        if self.shard_state == 'running':
+            raise UserError("La migración en shards de este modelo ya está en curso. Espera a que termine.")
+        if self.shard_count < 1 or self.shard_batch_size < 1:
+            raise UserError("El número de workers y el tamaño de lote deben ser mayores que cero.")
+
+        uid = config.connect()
+        if not uid:
+            raise UserError("No hay conexión con la base de datos origen.")
+
+        models_proxy = xmlrpc.client.ServerProxy(f"{config.source_url}/xmlrpc/2/object")
+        origin_model = self.model_origin.model
+        first_ids = models_proxy.execute_kw(
+            config.source_db, uid, config.source_password,
+            origin_model, 'search', [[]], {'order': 'id asc', 'limit': 1}
+        )
+        last_ids = models_proxy.execute_kw(
+            config.source_db, uid, config.source_password,
+            origin_model, 'search', [[]], {'order': 'id desc', 'limit': 1}
+        )
+        if not first_ids:
+            raise UserError(f"El modelo remoto {origin_model} no tiene registros.")
+        min_id, max_id = first_ids[0], last_ids[0]
+
+        # Limpiar shards, mapeos e instantánea anteriores de este modelo
+        self.shard_ids.unlink()
+        self.env['migration.id.mapping'].search([
+            ('config_id', '=', config.id),
+            ('model_name', '=', self.model_dest.model),
+        ]).unlink()
+        config._delete_mapping_snapshots(self.model_dest.model)
+
+        span = max_id - min_id + 1
+        count = min(self.shard_count, span)
+        bounds = [min_id + span * i // count for i in range(count + 1)]
+        self.env['migration.shard'].create([{
+            'model_id': self.id,
+            'start_id': bounds[i],
+            'end_id': bounds[i + 1] - 1,
+            'last_done_id': bounds[i] - 1,
+            'reserved_id': bounds[i] - 1,
+        } for i in range(count)])
+        self.shard_state = 'running'
+
+        _logger.info(f"🧩 {origin_model}: IDs [{min_id}, {max_id}] repartidos en {count} shards")
+        self._trigger_shard_workers()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Migración en Shards',
+                'message': f'{count} shards encolados para {self.shard_count} workers',
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def action_resume_sharded_migration(self):
+        """Vuelve a encolar los shards fallidos desde el último lote confirmado."""
+        self.ensure_one()
+        failed = self.shard_ids.filtered(lambda s: s.state == 'failed')
+        if not failed:
+            raise UserError("No hay shards fallidos que reanudar.")
+
+        # last_done_id se conserva: los lotes ya confirmados no se repiten
+        failed.write({'state': 'pending', 'worker': False, 'message': False})
+        self.shard_state = 'running'
+
+        _logger.info(f"🔁 {len(failed)} shards fallidos de {self.model_dest.model} reanudados")
+        self._trigger_shard_workers()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Migración en Shards',
+                'message': f'{len(failed)} shards fallidos reanudados',
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def _trigger_shard_workers(self):
+        """Asegura un cron worker por shard simultáneo y los dispara.
+
+        Odoo nunca ejecuta dos veces a la vez el mismo cron, así que el
+        paralelismo se obtiene con copias del cron worker de plantilla.
+        Hacen falta tantos ``max_cron_threads`` como workers.
+        """
+        template = self.env.ref('odoo_migration_app.ir_cron_migration_shard_worker').sudo()
+        workers = self.env['ir.cron'].sudo().search([('code', '=', template.code)])
+        wanted = max(self.mapped('shard_count') or [1])
+        for i in range(len(workers), wanted):
+            workers |= template.copy({'name': f"{template.name} #{i + 1}"})
+        for worker in workers:
+            worker._trigger()
+
+    def _rebalance_shards(self):
+        """Parte los shards más lentos si hay workers ociosos."""
+        self.ensure_one()
+        active = self.shard_ids.filtered(lambda s: s.state in ('pending', 'running'))
+        idle = self.shard_count - len(active)
+        if idle <= 0:
+            return
+
+        running = self.shard_ids.filtered(lambda s: s.state == 'running')
+        slowest = sorted(running, key=lambda s: s._estimated_seconds_left(), reverse=True)[:idle]
+        split = False
+        for shard in slowest:
+            split |= bool(shard._with_retry(shard._split))
+        if split:
+            self._trigger_shard_workers()
+
+    def _finish_sharded_migration(self):
+        self.ensure_one()
+        shards = self.shard_ids
+        failed = shards.filtered(lambda s: s.state == 'failed')
+        self.shard_state = 'done'
+        self.env['migration.log'].create({
+            'migration_name': self.config_id.name,
+            'status': 'failed' if failed else 'completed',
+            'message': (
+                f"{sum(shards.mapped('records_done'))} registros migrados en {len(shards)} shards"
+                + (f", {len(failed)} shards fallidos" if failed else "")
+            ),
+            'model_name': self.model_dest.model,
+        })
+        if self.config_id.reuse_mapping_snapshots:
+            self.config_id._export_mapping_snapshot(self.model_dest.model)
+        _logger.info(f"✅ Migración en shards de {self.model_dest.model} terminada")
@@ -0,0 +1,367 @@
+import http.client
+import logging
+import os
+import random
+import socket
+import time
+import xmlrpc.client
+from datetime import timedelta
+
+from odoo import models, fields, api  # type: ignore
+from psycopg2 import OperationalError, errorcodes  # type: ignore
+from psycopg2.errors import UniqueViolation  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+# Errores de concurrencia de PostgreSQL tras los que se reintenta la transacción
+PG_CONCURRENCY_ERRORS = (
+    errorcodes.LOCK_NOT_AVAILABLE,
+    errorcodes.SERIALIZATION_FAILURE,
+    errorcodes.DEADLOCK_DETECTED,
+)
+MAX_RETRIES = 5
+
+# Restricción unique(config_id, model_name, source_id) de migration.id.mapping
+MAPPING_CONSTRAINT = 'migration_id_mapping_unique_mapping'
+
+# Errores de red o del proxy del origen (timeouts, 502...) que se reintentan
+TRANSIENT_RPC_ERRORS = (OSError, http.client.HTTPException, xmlrpc.client.ProtocolError)
+
+# Un shard en curso sin latido durante este tiempo se considera abandonado
+STALE_MINUTES = 10
+
+# Segundos que trabaja cada ejecución del cron worker antes de devolver su
+# shard a pendiente; debe quedar holgura de un lote bajo limit_time_cpu y
+# limit_time_real_cron. Se puede cambiar con el parámetro del sistema.
+WORKER_TIME_BUDGET_PARAM = 'odoo_migration_app.shard_worker_time_budget'
+WORKER_TIME_BUDGET = 30
+
+
+def is_mapping_conflict(error):
+    """Indica si ``error`` es la violación de unicidad del propio mapeo de IDs."""
+    return isinstance(error, UniqueViolation) and error.diag.constraint_name == MAPPING_CONSTRAINT
+
+
+def is_retryable_error(error):
+    """Indica si un error de base de datos se resuelve repitiendo la transacción.
+
+    Además de los conflictos de concurrencia, incluye la violación de unicidad
+    de un mapeo que otro worker confirmó después de la instantánea actual.
+    Cualquier otra violación de unicidad es un fallo real del registro.
+    """
+    if is_mapping_conflict(error):
+        return True
+    return isinstance(error, OperationalError) and error.pgcode in PG_CONCURRENCY_ERRORS
+
+
+class MigrationShard(models.Model):
+    """Rango de IDs origen de un modelo, procesado por un único worker.
+
+    Cada worker es una ejecución de ``ir.cron`` (un proceso propio en modo
+    multi-worker) con su propio cursor y su propia sesión RPC. El rango
+    ``[start_id, end_id]`` se recorre por lotes: ``reserved_id`` marca el
+    lote en curso y ``last_done_id`` el último lote confirmado. El
+    coordinador solo modifica ``end_id`` al partir un shard lento.
+    """
+    _name = 'migration.shard'
+    _description = 'Shard de Migración'
+    _order = 'model_id, start_id'
+
+    model_id = fields.Many2one('migration.model', string="Modelo de Migración", required=True, ondelete='cascade')
+    config_id = fields.Many2one(
+        'migration.config',
+        string="Configuración de Migración",
+        related='model_id.config_id',
+        store=True
+    )
+    start_id = fields.Integer('Desde ID', required=True)
+    end_id = fields.Integer('Hasta ID', required=True)
+    last_done_id = fields.Integer('Último ID procesado')
+    reserved_id = fields.Integer('Último ID reservado')
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('running', 'En Progreso'),
+        ('done', 'Completado'),
+        ('failed', 'Fallido'),
+    ], string="Estado", default='pending', required=True, index=True)
+    records_done = fields.Integer('Registros migrados')
+    worker = fields.Char('Worker')
+    date_start = fields.Datetime('Inicio')
+    date_done = fields.Datetime('Fin')
+    heartbeat = fields.Datetime('Último latido')
+    message = fields.Text('Mensaje')
+
+    # ==========================
+    # TRANSACCIONES CORTAS
+    # ==========================
+    def _with_retry(self, func):
+        """Ejecuta ``func`` en una transacción corta propia y la confirma.
+
+        Confirma antes lo pendiente para que la transacción empiece con una
+        instantánea nueva, y la reintenta ante conflictos de concurrencia
+        con otros workers o con el coordinador.
+        """
+        cr = self.env.cr
+        cr.commit()
+        for attempt in range(MAX_RETRIES):
+            try:
+                result = func()
+                cr.commit()
+                return result
+            except OperationalError as e:
+                cr.rollback()
+                if e.pgcode not in PG_CONCURRENCY_ERRORS or attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+
+    def _call_rpc(self, func):
+        """Llama al origen reintentando los errores de red transitorios."""
+        for attempt in range(MAX_RETRIES):
+            try:
+                return func()
+            except TRANSIENT_RPC_ERRORS as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                _logger.warning(f"🔁 Error RPC transitorio en shard {self.id}, se reintenta: {str(e)}")
+                time.sleep(2 ** attempt)
+
+    def _lock(self, columns):
+        """Bloquea la fila del shard y devuelve los valores actuales de ``columns``."""
+        self.ensure_one()
+        self.invalidate_recordset()
+        self.env.cr.execute(
+            f"SELECT {', '.join(columns)} FROM migration_shard WHERE id = %s FOR UPDATE",
+            [self.id]
+        )
+        return self.env.cr.fetchone()
+
+    # ==========================
+    # WORKER
+    # ==========================
+    @api.model
+    def _cron_run_worker(self):
+        """Reclama shards pendientes y los procesa mientras le quede tiempo.
+
+        Odoo mata las ejecuciones de cron que superan ``limit_time_cpu`` o
+        ``limit_time_real_cron``, así que cada ejecución se limita a un
+        presupuesto de tiempo. Al agotarlo, el shard en curso vuelve a
+        pendiente conservando su avance y los workers se vuelven a disparar.
+        """
+        budget = int(self.env['ir.config_parameter'].sudo().get_param(
+            WORKER_TIME_BUDGET_PARAM, WORKER_TIME_BUDGET
+        ))
+        deadline = time.monotonic() + budget
+        while time.monotonic() < deadline:
+            shard = self._with_retry(self._claim_next)
+            if not shard:
+                return
+            try:
+                finished = shard._run(deadline)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error(f"💥 Shard {shard.id} fallido: {str(e)}")
+                shard._with_retry(lambda: shard.write({'state': 'failed', 'message': str(e)}))
+                continue
+            if not finished:
+                shard._with_retry(shard._requeue)
+                _logger.info(f"⏸️  Shard {shard.id} devuelto a pendiente en {shard.last_done_id} por presupuesto de tiempo")
+                break
+
+        if self.search_count([('state', '=', 'pending')]):
+            self.env['migration.model']._trigger_shard_workers()
+
+    @api.model
+    def _claim_next(self):
+        self.env.cr.execute("""
+            SELECT id FROM migration_shard
+             WHERE state = 'pending'
+             ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        if not row:
+            return self.browse()
+        shard = self.browse(row[0])
+        now = fields.Datetime.now()
+        shard.write({
+            'state': 'running',
+            'worker': f"{socket.gethostname()}:{os.getpid()}",
+            # Un shard retomado conserva su inicio para estimar bien su ritmo
+            'date_start': shard.date_start or now,
+            'heartbeat': now,
+        })
+        return shard
+
+    def _run(self, deadline):
+        """Procesa el shard lote a lote, confirmando cada lote por separado.
+
+        Devuelve ``True`` si el shard se ha completado y ``False`` si se ha
+        agotado el tiempo (``deadline``, en ``time.monotonic()``) antes.
+        """
+        self.ensure_one()
+        model = self.model_id
+        config = model.config_id
+        uid, models_proxy = self._call_rpc(config._open_rpc_session)
+        if not uid:
+            raise ValueError("No se pudo autenticar contra la base de datos origen.")
+
+        dest_model = model.model_dest.model
+        fields_to_fetch = model._get_origin_fields_to_fetch()
+        _logger.info(f"🧩 Shard {self.id} [{self.start_id}, {self.end_id}] de {dest_model} en {self.worker}")
+
+        while time.monotonic() < deadline:
+            batch_ids = self._with_retry(lambda: self._reserve_batch(models_proxy, uid))
+            if not batch_ids:
+                return True
+
+            records = self._call_rpc(lambda: models_proxy.execute_kw(
+                config.source_db, uid, config.source_password,
+                model.model_origin.model, 'read', [batch_ids],
+                {'fields': fields_to_fetch}
+            ))
+
+            processed = self._migrate_batch(models_proxy, uid, batch_ids, records)
+            self._with_retry(lambda: self._complete_batch(processed))
+        return False
+
+    def _migrate_batch(self, models_proxy, uid, batch_ids, records):
+        """Migra y confirma un lote, repitiéndolo entero ante conflictos con otros workers.
+
+        Al deshacer la transacción se deshacen también los registros ya
+        creados del lote, y en la transacción nueva los mapeos confirmados
+        por otros workers ya son visibles.
+        """
+        cr = self.env.cr
+        for attempt in range(MAX_RETRIES):
+            try:
+                processed = self._migrate_batch_once(models_proxy, uid, batch_ids, records)
+                cr.commit()
+                return processed
+            except Exception as e:
+                cr.rollback()
+                if not is_retryable_error(e) or attempt == MAX_RETRIES - 1:
+                    raise
+                _logger.warning(f"🔁 Conflicto en shard {self.id}, se repite el lote: {str(e)}")
+                time.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+
+    def _migrate_batch_once(self, models_proxy, uid, batch_ids, records):
+        model = self.model_id
+        config = model.config_id
+        dest_model = model.model_dest.model
+
+        # Si el shard se retoma tras una caída, el mapeo indica lo ya migrado
+        already_mapped = set(self.env['migration.id.mapping'].search([
+            ('config_id', '=', config.id),
+            ('model_name', '=', dest_model),
+            ('source_id', 'in', batch_ids),
+        ]).mapped('source_id'))
+
+        processed = 0
+        for rec in records:
+            if rec['id'] in already_mapped:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    if config._migrate_record(models_proxy, uid, model, rec):
+                        processed += 1
+            except Exception as e:
+                if is_retryable_error(e):
+                    raise
+                _logger.error(f"❌ Error en shard {self.id}, registro {rec['id']}: {str(e)}")
+                self.env['migration.log'].create({
+                    'migration_name': config.name,
+                    'status': 'failed',
+                    'message': f"Error en {dest_model} ID {rec['id']}: {str(e)}",
+                    'model_name': dest_model,
+                })
+        return processed
+
+    def _reserve_batch(self, models_proxy, uid):
+        """Reserva el siguiente lote de IDs origen o cierra el shard si no quedan."""
+        last_done_id, end_id = self._lock(['last_done_id', 'end_id'])
+        model = self.model_id
+        config = model.config_id
+        batch_ids = self._call_rpc(lambda: models_proxy.execute_kw(
+            config.source_db, uid, config.source_password,
+            model.model_origin.model, 'search',
+            [[('id', '>', last_done_id), ('id', '<=', end_id)]],
+            {'order': 'id asc', 'limit': model.shard_batch_size}
+        ))
+        now = fields.Datetime.now()
+        if not batch_ids:
+            self.write({
+                'state': 'done',
+                'last_done_id': end_id,
+                'reserved_id': end_id,
+                'date_done': now,
+                'heartbeat': now,
+            })
+            _logger.info(f"✅ Shard {self.id} completado ({self.records_done} registros)")
+            return []
+        self.write({'reserved_id': batch_ids[-1], 'heartbeat': now})
+        return batch_ids
+
+    def _complete_batch(self, processed):
+        reserved_id, records_done = self._lock(['reserved_id', 'records_done'])
+        self.write({
+            'last_done_id': reserved_id,
+            'records_done': records_done + processed,
+            'heartbeat': fields.Datetime.now(),
+        })
+
+    # ==========================
+    # COORDINADOR
+    # ==========================
+    @api.model
+    def _cron_coordinate_shards(self):
+        """Recupera shards abandonados, reparte los lentos y cierra los modelos terminados."""
+        stale = self.search([
+            ('state', '=', 'running'),
+            ('heartbeat', '<', fields.Datetime.now() - timedelta(minutes=STALE_MINUTES)),
+        ])
+        for shard in stale:
+            _logger.warning(f"⚠️  Shard {shard.id} sin latido desde {shard.heartbeat}, se reencola")
+            shard._with_retry(lambda: shard._requeue())
+        if stale:
+            self.env['migration.model']._trigger_shard_workers()
+
+        for model in self.env['migration.model'].search([('shard_state', '=', 'running')]):
+            if all(s.state in ('done', 'failed') for s in model.shard_ids):
+                model._finish_sharded_migration()
+            else:
+                model._rebalance_shards()
+
+    def _requeue(self):
+        state, = self._lock(['state'])
+        if state == 'running':
+            self.write({'state': 'pending', 'worker': False})
+
+    def _estimated_seconds_left(self):
+        """Estima lo que le queda al shard según su ritmo medio hasta ahora."""
+        self.ensure_one()
+        remaining = self.end_id - max(self.reserved_id, self.last_done_id)
+        advanced = self.last_done_id - (self.start_id - 1)
+        elapsed = (fields.Datetime.now() - (self.date_start or fields.Datetime.now())).total_seconds()
+        if advanced <= 0 or elapsed <= 0:
+            return float('inf') if remaining > 0 else 0
+        return remaining * elapsed / advanced
+
+    def _split(self):
+        """Parte el rango que le queda al shard y encola la mitad final como shard nuevo."""
+        state, reserved_id, last_done_id, end_id = self._lock(['state', 'reserved_id', 'last_done_id', 'end_id'])
+        frontier = max(reserved_id, last_done_id)
+        if state != 'running' or end_id - frontier < 2 * self.model_id.shard_batch_size:
+            return False
+
+        middle = frontier + (end_id - frontier) // 2
+        self.write({'end_id': middle})
+        self.create({
+            'model_id': self.model_id.id,
+            'start_id': middle + 1,
+            'end_id': end_id,
+            'last_done_id': middle,
+            'reserved_id': middle,
+        })
+        _logger.info(f"✂️  Shard {self.id} partido en {middle}: [{middle + 1}, {end_id}] pasa a un shard nuevo")
+        return True
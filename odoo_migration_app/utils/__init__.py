@@ -1,2 +1,3 @@
 from . import connection
 from . import field_mapper
+from . import mapping_snapshot
@@ -0,0 +1,14 @@
+"""Sesiones XML-RPC contra la base de datos origen."""
+import xmlrpc.client
+
+
+def open_session(url, db, user, password):
+    """Autentica contra el origen y devuelve ``(uid, models_proxy)``.
+
+    Cada llamada crea sus propios proxies, de modo que cada worker de una
+    migración en shards trabaja con una sesión RPC independiente.
+    ``uid`` es ``False`` si la autenticación falla.
+    """
+    common = xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/common")
+    uid = common.authenticate(db, user, password, {})
+    return uid, xmlrpc.client.ServerProxy(f"{url}/xmlrpc/2/object")
@@ -0,0 +1,29 @@
+"""Índice precalculado de campos destino usado por el auto-mapeo."""
+
+
+class FieldIndex:
+    """Indexa los campos de un modelo destino por nombre técnico.
+
+    Se construye una sola vez por modelo a partir de un ``search_read`` sobre
+    ``ir.model.fields`` y permite resolver cada campo origen en O(1), sin
+    volver a consultar la base de datos por cada campo.
+    """
+
+    def __init__(self, dest_fields):
+        self._by_name = {f['name']: f for f in dest_fields}
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def match(self, name, ttype, relation=None):
+        """Devuelve el ID del campo destino equivalente o ``None``.
+
+        Un campo coincide si tiene el mismo nombre técnico y el mismo tipo.
+        En los relacionales también debe apuntar al mismo modelo.
+        """
+        candidate = self._by_name.get(name)
+        if not candidate or candidate['ttype'] != ttype:
+            return None
+        if relation and (candidate.get('relation') or '') != relation:
+            return None
+        return candidate['id']
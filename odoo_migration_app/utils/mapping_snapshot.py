@@ -0,0 +1,142 @@
+"""Instantáneas binarias compactas de mapeos de IDs origen → destino.
+
+Formato del fichero: cabecera ``(magic, n)`` seguida de ``n`` IDs origen
+ordenados y de sus ``n`` IDs destino, todos enteros de 64 bits. El fichero
+se abre con ``mmap`` y cada búsqueda es una bisección sobre los IDs origen.
+"""
+import array
+import bisect
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'OMIGMAP1'
+HEADER = struct.Struct('=8sQ')
+ITEM_SIZE = 8
+
+# Instantáneas abiertas por ruta (``None`` si el fichero está dañado),
+# invalidadas cuando el fichero cambia. Los crons pueden ser hilos de un
+# mismo proceso: una instantánea sustituida no se cierra explícitamente,
+# porque otro hilo puede seguir usándola; se desmapea al dejar de
+# referenciarse.
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class MappingSnapshot:
+    """Vista de solo lectura sobre una instantánea mapeada en memoria."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC or len(self._mmap) != HEADER.size + 2 * count * ITEM_SIZE:
+                raise ValueError(f"Instantánea de mapeo no válida: {path}")
+        except (ValueError, struct.error):
+            self._mmap.close()
+            raise
+        self._view = memoryview(self._mmap)
+        middle = HEADER.size + count * ITEM_SIZE
+        self._sources = self._view[HEADER.size:middle].cast('q')
+        self._dests = self._view[middle:].cast('q')
+
+    def __len__(self):
+        return len(self._sources)
+
+    def get(self, source_id):
+        """Devuelve el ID destino de ``source_id`` o ``None``, en O(log n)."""
+        i = bisect.bisect_left(self._sources, source_id)
+        if i < len(self._sources) and self._sources[i] == source_id:
+            return self._dests[i]
+        return None
+
+
+def write_snapshot(path, rows, chunk_size=65536):
+    """Escribe una instantánea a partir de pares ``(source_id, dest_id)`` ordenados por origen.
+
+    Los pares se vuelcan por bloques de ``chunk_size``: los IDs origen van
+    directamente al fichero y los destino a un temporal que se añade al
+    final, así la memoria no crece con el número de mapeos. Se escribe en un
+    fichero temporal y se renombra, de modo que los lectores nunca ven una
+    instantánea a medias. Devuelve el número de pares.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    dests_path = f"{path}.dests.tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'wb') as f, open(dests_path, 'w+b') as f_dests:
+            f.write(HEADER.pack(MAGIC, 0))
+            sources = array.array('q')
+            dests = array.array('q')
+            for source_id, dest_id in rows:
+                sources.append(source_id)
+                dests.append(dest_id)
+                if len(sources) >= chunk_size:
+                    count += len(sources)
+                    sources.tofile(f)
+                    dests.tofile(f_dests)
+                    del sources[:], dests[:]
+            count += len(sources)
+            sources.tofile(f)
+            dests.tofile(f_dests)
+
+            f_dests.seek(0)
+            shutil.copyfileobj(f_dests, f)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, count))
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, dests_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return count
+
+
+def load_snapshot(path):
+    """Devuelve la instantánea de ``path`` (reutilizando la ya abierta) o ``None``.
+
+    Una instantánea es solo una caché: si falta o está dañada se devuelve
+    ``None`` y la búsqueda sigue en la tabla de mapeos.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _discard(path)
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _snapshots_lock:
+        cached = _snapshots.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        try:
+            snapshot = MappingSnapshot(path)
+        except (ValueError, struct.error, OSError) as e:
+            # Se recuerda el fallo para no reabrir ni avisar en cada búsqueda
+            _logger.warning(f"⚠️  Instantánea de mapeo ignorada {path}: {str(e)}")
+            snapshot = None
+        _snapshots[path] = (key, snapshot)
+        return snapshot
+
+
+def _discard(path):
+    """Olvida la instantánea abierta de ``path``, si la hay."""
+    with _snapshots_lock:
+        _snapshots.pop(path, None)
+
+
+def delete_snapshot(path):
+    """Olvida la instantánea abierta de ``path`` y borra el fichero si existe."""
+    _discard(path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass